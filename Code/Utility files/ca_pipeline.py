@@ -1,4 +1,7 @@
+import glob
+import hashlib
 import os
+import re
 import sys
 from collections import defaultdict
 
@@ -9,11 +12,159 @@ import pandas as pd
 import prince
 import numpy as np
 from matplotlib import pyplot as plt
+import scipy
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import LinearOperator, svds
+import sklearn
+from sklearn.utils.extmath import svd_flip
+from joblib import Memory
 from networkx.algorithms import bipartite
 from netgraph import Graph
 from matplotlib.ticker import FuncFormatter
 
+# igraph's C implementation of the Louvain method is used for the communities when it is installed
+try:
+    import igraph as ig
+except ImportError:
+    ig = None
 
+# Fitted CA models and Louvain partitions are cached on disk, keyed on a hash of the edgelist,
+# so re-running a notebook cell on the same data does not refit them. The cache lives in the project folder
+# (Code/.ca_cache) unless the CA_CACHE_DIR environment variable points elsewhere
+CACHE_DIR = os.environ.get('CA_CACHE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.ca_cache'))
+_memory = Memory(CACHE_DIR, verbose=0)
+
+# Bump _CACHE_VERSION whenever one of the cached functions below changes what it returns. The token also holds the versions
+# of the libraries doing the computations, and is passed to every cached call so that stale results are never reused
+_CACHE_VERSION = 1
+_CACHE_TOKEN = '-'.join([str(_CACHE_VERSION), np.__version__, scipy.__version__, sklearn.__version__, prince.__version__,
+                         nx.__version__, community_louvain.__version__, ig.__version__ if ig is not None else 'no-igraph'])
+
+
+class SparseCA:
+    """
+    Correspondence Analysis of a sparse contingency table.
+
+    Computes the same decomposition as prince.CA without forming the dense matrix of standardised residuals
+    S = D_r^-1/2 (P - r c^T) D_c^-1/2. S is the sparse matrix A = D_r^-1/2 P D_c^-1/2 minus the rank one term
+    sqrt(r) sqrt(c)^T, so the truncated SVD (scipy.sparse.linalg.svds) only multiplies vectors by A and that term.
+    Singular vectors get the sign convention of sklearn's randomized_svd, which prince.CA uses.
+
+    Attributes:
+    -----------
+    eigenvalues_ : np.ndarray
+        The principal inertias of the kept dimensions.
+    total_inertia_ : float
+        The total inertia of the table.
+    percentage_of_variance_ : np.ndarray
+        The percentage of the total inertia explained by each kept dimension.
+    """
+    def __init__(self, n_components=8, random_state=42):
+        self.n_components = n_components
+        self.random_state = random_state
+
+    def fit(self, X, row_names, col_names):
+        """
+        Fits the CA on a sparse table X whose rows and columns are labelled by row_names and col_names.
+        """
+        # Correspondence matrix and row and column masses
+        P = sparse.csr_matrix(X, dtype=float)
+        P = P / P.sum()
+        sqrt_r = np.sqrt(np.asarray(P.sum(axis=1)).ravel())
+        sqrt_c = np.sqrt(np.asarray(P.sum(axis=0)).ravel())
+        A = sparse.diags(1 / sqrt_r) @ P @ sparse.diags(1 / sqrt_c)
+
+        S = LinearOperator(
+            P.shape,
+            matvec=lambda x: A @ x - sqrt_r * (sqrt_c @ x),
+            rmatvec=lambda y: A.T @ y - sqrt_c * (sqrt_r @ y),
+            matmat=lambda X: A @ X - np.outer(sqrt_r, sqrt_c @ X),
+            rmatmat=lambda Y: A.T @ Y - np.outer(sqrt_c, sqrt_r @ Y),
+            dtype=float,
+        )
+        k = min(self.n_components, min(P.shape) - 1)
+        U, s, Vt = svds(S, k=k, random_state=self.random_state)
+
+        # svds returns the singular values in increasing order
+        order = np.argsort(s)[::-1]
+        U, Vt = svd_flip(U[:, order], Vt[order])
+        s = s[order]
+
+        self.eigenvalues_ = s ** 2
+        # ||S||^2 = ||A||^2 - 1, as sqrt(r)^T A sqrt(c) sums P
+        self.total_inertia_ = A.multiply(A).sum() - 1
+        self.percentage_of_variance_ = 100 * self.eigenvalues_ / self.total_inertia_
+
+        # Principal coordinates of the rows and columns
+        self._row_coordinates = pd.DataFrame(U / sqrt_r[:, None] * s, index=row_names)
+        self._column_coordinates = pd.DataFrame(Vt.T / sqrt_c[:, None] * s, index=col_names)
+        return self
+
+    def row_coordinates(self):
+        return self._row_coordinates
+
+    def column_coordinates(self):
+        return self._column_coordinates
+
+
+@_memory.cache(ignore=['incidence_matrix', 'row_names', 'col_names'])
+def _fit_sparse_ca(edgelist_hash, cache_version, incidence_matrix, row_names, col_names, n_components):
+    return SparseCA(n_components=n_components, random_state=42).fit(incidence_matrix, row_names, col_names)
+
+
+@_memory.cache(ignore=['contingency_table'])
+def _fit_ca(edgelist_hash, cache_version, contingency_table, n_components, n_iter):
+    # Initialize a CA object
+    ca = prince.CA(
+        n_components=n_components,  # Number of components to keep
+        n_iter=n_iter,  # Number of iterations for the power method
+        copy=True,  # Whether to overwrite the data matrix
+        check_input=True,  # Whether to check the input for NaNs and Infs
+        engine='sklearn',  # Whether to perform computations in C or Python
+        random_state=42  # Random seed for reproducibility
+    )
+
+    # Fit the CA model on the contingency table
+    return ca.fit(contingency_table)
+
+
+@_memory.cache(ignore=['graph'])
+def _louvain_partition(edgelist_hash, cache_version, graph, use_igraph):
+    if use_igraph:
+        # Rebuild the weighted projection in igraph, with vertices in the same order as the networkx nodes
+        nodes = list(graph.nodes())
+        node_ids = {node: i for i, node in enumerate(nodes)}
+        edges = [(node_ids[u], node_ids[v]) for u, v in graph.edges()]
+        weights = [w for _, _, w in graph.edges(data='weight', default=1)]
+        g = ig.Graph(n=len(nodes), edges=edges)
+        membership = g.community_multilevel(weights=weights).membership
+        return dict(zip(nodes, membership))
+
+    return community_louvain.best_partition(graph)
+
+
+@_memory.cache(ignore=['graph'])
+def _marker_layout(edgelist_hash, cache_version, graph, use_igraph):
+    if use_igraph:
+        # igraph's Fruchterman-Reingold layout (the force-directed model of spring_layout) runs in C
+        nodes = list(graph.nodes())
+        if not nodes:
+            return {}
+        node_ids = {node: i for i, node in enumerate(nodes)}
+        edges = [(node_ids[u], node_ids[v]) for u, v in graph.edges()]
+        weights = [w for _, _, w in graph.edges(data='weight', default=1)]
+        g = ig.Graph(n=len(nodes), edges=edges)
+        coords = np.array(g.layout_fruchterman_reingold(weights=weights).coords)
+
+        # Center and scale the positions to [-1, 1] like spring_layout, so the label distance in plot_w_marker_relations still applies
+        coords -= coords.mean(axis=0)
+        scale = np.abs(coords).max()
+        if scale > 0:
+            coords /= scale
+        return dict(zip(nodes, coords))
+
+    return nx.spring_layout(graph, weight='weight')
 
 
 class PipelineCorAnalysis:
@@ -29,17 +180,26 @@ Attributes:
         The name of the edge list, derived from the provided data subset name.
     subset_name : str
         The name of the data subset.
+    overwrite_policy : str
+        What to do when a coordinates file already exists: 'suffix' (default) saves to a new file with a numbered suffix,
+        'overwrite' replaces the file, and 'prompt' asks the user.
     B : nx.DiGraph
         The bipartite graph created from the data subset (initialized in create_bipartite_graph method).
+    incidence_matrix : scipy.sparse.csr_matrix
+        Sparse follower x marker matrix with the number of edges between each pair (initialized in create_incidence_matrix method).
+    follower_index : pd.Index
+        The follower IDs labelling the rows of the incidence matrix (initialized in create_incidence_matrix method).
+    marker_index : pd.Index
+        The marker names labelling the columns of the incidence matrix (initialized in create_incidence_matrix method).
     G_markers : nx.Graph
         The unweighted projection of the markers (initialized in marker_projection method).
     G2_markers : nx.Graph
-        The weighted projection of the markers (initialized in marker_projection method).
+        The weighted projection of the markers, weighted by the number of shared followers (initialized in marker_projection method).
     partition : dict
         The partition of the graph computed by the Louvain method (initialized in calculate_communities method).
     contingency_table : pd.DataFrame
-        The contingency table created for Correspondence Analysis (initialized in create_contingency_table method).
-    ca : prince.CA
+        The dense contingency table used by the 'prince' CA engine (initialized in create_contingency_table method).
+    ca : SparseCA or prince.CA
         The Correspondence Analysis model (initialized in perform_ca_analysis method).
 
     Methods:
@@ -48,6 +208,10 @@ Attributes:
         Returns the edge list name, which is identical to the provided data subset name.
     create_bipartite_graph():
         Creates a bipartite graph from the data subset.
+    create_incidence_matrix():
+        Creates a sparse follower x marker incidence matrix from the data subset.
+    edgelist_hash():
+        Returns a hash of the incidence matrix, used to cache the CA and Louvain results in CACHE_DIR.
     sanity_checks():
         Performs sanity checks on the bipartite graph.
     connectedness():
@@ -57,27 +221,30 @@ Attributes:
     top_five_markers_in_degree():
         Identifies and prints the top five markers based on in-degree centrality.
     marker_projection():
-        Creates unweighted and weighted projections of the markers from the bipartite graph.
+        Creates unweighted and weighted projections of the markers from the sparse incidence matrix.
+    marker_projection_bipartite():
+        Creates the same projections from the bipartite graph with networkx.
     plot_w_marker_relations():
         Plots the relationships between markers in the weighted projection graph.
     calculate_communities():
-        Calculates and prints the number of communities using the Louvain method.
+        Calculates and prints the number of communities using the Louvain method (through igraph when it is installed).
     perform_graph_checks():
         Runs a series of graph analysis methods.
     create_contingency_table():
         Creates a contingency table from the data subset.
-    perform_ca_analysis(save_path, n_components=100, n_iter=100):
-        Performs Correspondence Analysis on the contingency table and saves the results.
+    perform_ca_analysis(save_path, n_components=8, n_iter=5, fmt='csv', engine='sparse'):
+        Performs Correspondence Analysis on the sparse incidence matrix (or, with engine='prince', the dense contingency table)
+        and saves the first four dimensions as CSV or parquet files.
     plot_variance():
         Plots the percentage of variance explained by each dimension in the Correspondence Analysis.
     get_unique_filepath(filepath):
-        Generates a unique file path to avoid overwriting existing files.
-    perform_ca_pipeline(save_path):
+        Returns the path to save to, following the overwrite policy when the file already exists.
+    perform_ca_pipeline(save_path, n_components=8, n_iter=5, fmt='csv', engine='sparse'):
         Runs the full CA pipeline: creating the contingency table, performing CA, and plotting variance.
     run_all(save_path):
         Executes all the main graph checks and the CA pipeline.
 """
-    def __init__(self, data_subset, data_subset_name):
+    def __init__(self, data_subset, data_subset_name, overwrite_policy='suffix'):
         if not isinstance(data_subset, pd.DataFrame):
             raise ValueError("data_subset must be a pandas DataFrame")
 
@@ -85,10 +252,20 @@ Attributes:
         if not all(column in data_subset.columns for column in required_columns):
             raise ValueError(f"data_subset must contain the following columns: {required_columns}")
 
+        if overwrite_policy not in ('prompt', 'overwrite', 'suffix'):
+            raise ValueError('Invalid overwrite_policy. Expected "prompt", "overwrite" or "suffix".')
+
         self.data_subset = data_subset
+        self.overwrite_policy = overwrite_policy
         self.edgelist_name = self.get_edgelist_name(data_subset_name)
         self.subset_name = data_subset_name  
 
+        # Map each marker to the type of its first row once, for top_five_markers_in_degree. None when the data has no types
+        self._name_to_type2 = None
+        if 'type2' in data_subset.columns:
+            first_rows = data_subset.drop_duplicates('twitter_name')
+            self._name_to_type2 = dict(zip(first_rows['twitter_name'], first_rows['type2']))
+
     def get_edgelist_name(self, data_subset_name):
         """
         Returns the edge list name identical to `data_subset_name`.
@@ -118,6 +295,37 @@ Attributes:
         except Exception as e:
             print(f"Error occurred while creating bipartite graph: {str(e)}")
     
+    def create_incidence_matrix(self):
+        # Edges with a missing follower or marker are left out, as pd.crosstab does. Followers and markers that only
+        # appear on such edges then get no row or column
+        edges = self.data_subset[['follower_id', 'twitter_name']].dropna()
+
+        # Encode followers and markers as categorical codes. The sorted categories label the rows and columns
+        followers = edges['follower_id'].astype('category').cat.remove_unused_categories()
+        markers = edges['twitter_name'].astype('category').cat.remove_unused_categories()
+
+        # One entry per edge, duplicate edges are summed when the matrix is built
+        data = np.ones(len(edges), dtype=np.int32)
+        shape = (len(followers.cat.categories), len(markers.cat.categories))
+        self.incidence_matrix = sparse.csr_matrix((data, (followers.cat.codes, markers.cat.codes)), shape=shape)
+
+        self.follower_index = followers.cat.categories
+        self.marker_index = markers.cat.categories
+
+    def edgelist_hash(self):
+        """
+        Returns a hash of the incidence matrix and its labels, used as the cache key for the CA and Louvain results.
+        """
+        if not hasattr(self, 'incidence_matrix'):
+            self.create_incidence_matrix()
+
+        h = hashlib.sha1()
+        for array in (self.incidence_matrix.indptr, self.incidence_matrix.indices, self.incidence_matrix.data):
+            h.update(array.tobytes())
+        for labels in (self.follower_index, self.marker_index):
+            h.update(pd.util.hash_pandas_object(labels, index=False).to_numpy().tobytes())
+        return h.hexdigest()
+
     def sanity_checks(self):
         if not hasattr(self, 'B'):
             raise AttributeError("Bipartite graph not created. Call create_bipartite_graph first.")
@@ -129,37 +337,47 @@ Attributes:
         if num_edges == num_rows:
             print("Edge number is sane - matches the number of rows in the inputted edgelist")
 
-        B_undirected = self.B.to_undirected()
-        print("Is the graph connected?", nx.is_connected(B_undirected))
+        # The graph is connected if its undirected version has a single component
+        n_components, _ = connected_components(self._bipartite_adjacency(), directed=True, connection='weak')
+        print("Is the graph connected?", n_components == 1)
+
+    def _bipartite_adjacency(self):
+        if not hasattr(self, 'incidence_matrix'):
+            self.create_incidence_matrix()
+
+        # Directed adjacency matrix of the bipartite graph, followers first and markers after.
+        # Edges only go from followers to markers, so only the upper right block is filled
+        n_followers, n_markers = self.incidence_matrix.shape
+        return sparse.bmat([[None, self.incidence_matrix], [sparse.csr_matrix((n_markers, n_followers)), None]], format='csr')
 
     def connectedness(self):
+        adjacency = self._bipartite_adjacency()
+
         # Calculate weakly connected components
-        weakly_connected_components = list(nx.weakly_connected_components(self.B))
+        n_weak, weak_labels = connected_components(adjacency, directed=True, connection='weak')
 
         # Print the number of weakly connected components
-        print("Number of weakly connected components:", len(weakly_connected_components))
+        print("Number of weakly connected components:", n_weak)
 
         # Print the size of the largest weakly connected component
-        print("Size of largest weakly connected component:", max(len(c) for c in weakly_connected_components))
+        print("Size of largest weakly connected component:", np.bincount(weak_labels).max())
 
         # Calculate strongly connected components
-        strongly_connected_components = list(nx.strongly_connected_components(self.B))
+        n_strong, strong_labels = connected_components(adjacency, directed=True, connection='strong')
 
         # Print the number of strongly connected components
-        print("Number of strongly connected components:", len(strongly_connected_components))
+        print("Number of strongly connected components:", n_strong)
 
         # Print the size of the largest strongly connected component
-        print("Size of largest strongly connected component:", max(len(c) for c in strongly_connected_components))
+        print("Size of largest strongly connected component:", np.bincount(strong_labels).max())
     
     def plot_degree_cdf(self):
-        followers = [n for n, d in self.B.nodes(data=True) if d['bipartite']==0]
-        markers = [n for n, d in self.B.nodes(data=True) if d['bipartite']==1]
+        if not hasattr(self, 'incidence_matrix'):
+            self.create_incidence_matrix()
 
-        in_degrees = [d for n, d in self.B.in_degree(markers)]
-        out_degrees = [d for n, d in self.B.out_degree(followers)] #get out degrees for followers
-
-        degrees_out = np.array(out_degrees)
-        degrees_in = np.array(in_degrees)
+        # Degrees are the number of distinct neighbours, i.e. the stored entries per row (followers) and per column (markers)
+        degrees_out = self.incidence_matrix.getnnz(axis=1) #out degrees for followers
+        degrees_in = self.incidence_matrix.getnnz(axis=0) #in degrees for markers
 
         # Calculate the complementary cumulative distribution function (CCDF) for out_degrees
         counts, bin_edges = np.histogram(degrees_out, bins=range(1, max(degrees_out) + 1), density=True)
@@ -205,11 +423,44 @@ Attributes:
         top_five_markers = sorted(marker_in_degree.items(), key=lambda item: item[1], reverse=True)[:5]
 
         # Print the top five markers and their types
+        if self._name_to_type2 is None:
+            print("The data has no 'type2' column, so the marker types are not shown.")
         for marker, centrality in top_five_markers:
-            marker_type = self.data_subset[self.data_subset['twitter_name'] == marker]['type2'].iloc[0]
-            print(f"Marker: {marker}, Type: {marker_type}, In-Degree Centrality: {centrality}")
+            if self._name_to_type2 is None:
+                print(f"Marker: {marker}, In-Degree Centrality: {centrality}")
+            else:
+                marker_type = self._name_to_type2[marker]
+                print(f"Marker: {marker}, Type: {marker_type}, In-Degree Centrality: {centrality}")
     
     def marker_projection(self):
+        if not hasattr(self, 'incidence_matrix'):
+            self.create_incidence_matrix()
+
+        # Binary follower x marker matrix, so that repeated edges count once as in the graph
+        M = (self.incidence_matrix > 0).astype(np.int32)
+
+        # Entry (i, j) of M.T @ M is the number of followers shared by markers i and j, i.e. the weight in the weighted projection.
+        # Only the upper triangle is needed for an undirected graph, which also drops the diagonal
+        W = sparse.triu(M.T @ M, k=1).tocoo()
+        sources = self.marker_index[W.row].tolist()
+        targets = self.marker_index[W.col].tolist()
+
+        # Weighted projection for markers
+        G2_markers = nx.Graph()
+        G2_markers.add_nodes_from(self.marker_index, bipartite=1)
+        G2_markers.add_weighted_edges_from(zip(sources, targets, W.data.tolist()))
+
+        # Create the projection for markers (unweighted)
+        G_markers = nx.Graph()
+        G_markers.add_nodes_from(self.marker_index, bipartite=1)
+        G_markers.add_edges_from(zip(sources, targets))
+
+        # Store the projections for later use
+        self.G_markers = G_markers
+        self.G2_markers = G2_markers
+
+    def marker_projection_bipartite(self):
+        # Projection through networkx.bipartite, kept for comparison with marker_projection
         if not hasattr(self, 'B'):
             raise AttributeError("Bipartite graph not created. Call create_bipartite_graph first.")
         # Separate nodes into two sets
@@ -237,15 +488,13 @@ Attributes:
         unique_types = self.data_subset['type2'].unique()
         type_color = {utype: color_dict.get(utype, 'gray') for utype in unique_types}  # Use gray for missing types
 
-        # Create a dictionary that maps each twitter_name to its type
+        # Create a list of colors for each node in the graph. Markers with several types are colored by the type of their last row
         twitter_name_to_type = dict(zip(self.data_subset['twitter_name'], self.data_subset['type2']))
-
-        # Create a list of colors for each node in the graph
-        node_colors = [type_color[twitter_name_to_type.get(node, 'gray')] for node in self.G2_markers.nodes()]  # Use gray for missing types
+        node_colors = [type_color.get(twitter_name_to_type.get(node), 'gray') for node in self.G2_markers.nodes()]  # Use gray for missing types
 
         # Draw the graph with node colors
         plt.figure(figsize=(10, 10))  # Increase figure size
-        pos = nx.spring_layout(self.G2_markers, weight='weight')  # Use spring layout
+        pos = _marker_layout(self.edgelist_hash(), _CACHE_TOKEN, self.G2_markers, ig is not None)  # Spring layout, cached per edgelist
 
         # Draw edges with increased alpha
         nx.draw_networkx_edges(self.G2_markers, pos, alpha=0.09, width=0.1)
@@ -282,8 +531,8 @@ Attributes:
     def calculate_communities(self):
         if not hasattr(self, 'G2_markers'):
             self.marker_projection()
-        # Compute the best partition using the Louvain method
-        partition = community_louvain.best_partition(self.G2_markers) #result is a dict where key = node and value = community
+        # Compute the best partition using the Louvain method (cached per edgelist)
+        partition = _louvain_partition(self.edgelist_hash(), _CACHE_TOKEN, self.G2_markers, ig is not None) #result is a dict where key = node and value = community
 
         # Get the number of unique communities
         num_communities = len(set(partition.values()))
@@ -308,29 +557,39 @@ Attributes:
     
     # CA fitting methods
     def create_contingency_table(self):
-        # Create the contingency table
-        self.contingency_table = pd.crosstab(self.data_subset['follower_id'], self.data_subset['twitter_name'])
+        if not hasattr(self, 'incidence_matrix'):
+            self.create_incidence_matrix()
+
+        # Create the contingency table from the sparse incidence matrix, which holds the same counts as pd.crosstab.
+        # It is densified here because prince.CA centres the matrix densely during fitting anyway
+        self.contingency_table = pd.DataFrame(
+            self.incidence_matrix.toarray(),
+            index=pd.Index(self.follower_index, name='follower_id'),
+            columns=pd.Index(self.marker_index, name='twitter_name'),
+        )
     
-    def perform_ca_analysis(self, save_path, n_components=100, n_iter=100):
+    def perform_ca_analysis(self, save_path, n_components=8, n_iter=5, fmt='csv', engine='sparse'):
+        # Only the first four dimensions are saved, so a few more components than that are enough for them to be stable.
+        # Raise n_components to see more dimensions in plot_variance.
+        # engine='sparse' fits SparseCA on the sparse incidence matrix with an exact truncated SVD (n_iter is not used).
+        # engine='prince' fits prince.CA on the dense contingency table with n_iter randomized power iterations
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError('Invalid fmt. Expected "csv" or "parquet".')
+        if engine not in ('sparse', 'prince'):
+            raise ValueError('Invalid engine. Expected "sparse" or "prince".')
         try:
-            # Initialize a CA object
-            ca = prince.CA(
-                n_components=n_components,  # Number of components to keep
-                n_iter=n_iter,  # Number of iterations for the power method
-                copy=True,  # Whether to overwrite the data matrix
-                check_input=True,  # Whether to check the input for NaNs and Infs
-                engine='sklearn',  # Whether to perform computations in C or Python
-                random_state=42  # Random seed for reproducibility
-            )
-
-            # Fit the CA model on the contingency table
-            ca.fit(self.contingency_table)
+            # Fit the CA model (cached per edgelist) and get the coordinates of the rows (followers) and columns (brands)
+            if engine == 'sparse':
+                ca = _fit_sparse_ca(self.edgelist_hash(), _CACHE_TOKEN, self.incidence_matrix, pd.Index(self.follower_index, name='follower_id'),
+                                    pd.Index(self.marker_index, name='twitter_name'), n_components)
+                row_coordinates = ca.row_coordinates()
+                column_coordinates = ca.column_coordinates()
+            else:
+                ca = _fit_ca(self.edgelist_hash(), _CACHE_TOKEN, self.contingency_table, n_components, n_iter)
+                row_coordinates = ca.row_coordinates(self.contingency_table)
+                column_coordinates = ca.column_coordinates(self.contingency_table)
             self.ca = ca
 
-            # Get the coordinates of the rows (followers) and columns (brands) 
-            row_coordinates = ca.row_coordinates(self.contingency_table)
-            column_coordinates = ca.column_coordinates(self.contingency_table)
-
             # If 'label', 'type', and 'type2' columns exist in the original data, add them to the column coordinates
             if all(item in self.data_subset.columns for item in ['label', 'type', 'type2']):
                 column_coordinates = column_coordinates.merge(self.data_subset[['twitter_name', 'label', 'type', 'type2']].drop_duplicates(), left_index=True, right_on='twitter_name')
@@ -344,26 +603,35 @@ Attributes:
             if not os.path.exists(new_dir_path):
                 os.makedirs(new_dir_path)
 
-            # Save the row and column coordinates to CSV files in the new directory
+            # Save the row and column coordinates to CSV (or parquet) files in the new directory
             # If a file already exists, add a unique suffix to the filename
-            row_file_path = os.path.join(new_dir_path, f'{self.edgelist_name}_row_coordinates.csv')
-            column_file_path = os.path.join(new_dir_path, f'{self.edgelist_name}_column_coordinates.csv')
+            row_file_path = os.path.join(new_dir_path, f'{self.edgelist_name}_row_coordinates.{fmt}')
+            column_file_path = os.path.join(new_dir_path, f'{self.edgelist_name}_column_coordinates.{fmt}')
             row_file_path = self.get_unique_filepath(row_file_path)
             column_file_path = self.get_unique_filepath(column_file_path)
 
             # Save only the first four dimensions and the 'twitter_name', 'label', 'type', and 'type2' columns
             if all(item in column_coordinates.columns for item in ['label', 'type', 'type2']):
-                column_coordinates[['twitter_name', 'label', 'type', 'type2'] + list(column_coordinates.columns[:4])].to_csv(column_file_path)
+                self._save_table(column_coordinates[['twitter_name', 'label', 'type', 'type2'] + list(column_coordinates.columns[:4])], column_file_path, fmt)
             else:
-                column_coordinates.to_csv(column_file_path)
+                self._save_table(column_coordinates, column_file_path, fmt)
 
             # Save only the first four dimensions
-            row_coordinates.iloc[:, :4].to_csv(row_file_path)
+            self._save_table(row_coordinates.iloc[:, :4], row_file_path, fmt)
 
         except Exception as e:
             print(f"Error occurred while performing CA analysis: {str(e)}")
  
 
+    def _save_table(self, df, file_path, fmt):
+        if fmt == 'csv':
+            df.to_csv(file_path)
+        else:
+            # Parquet needs string column names. The index is stored as a regular column named as pd.read_csv would name it,
+            # so that both formats load into the same DataFrame
+            df = df.rename(columns=str).reset_index(names=df.index.name or 'Unnamed: 0')
+            df.to_parquet(file_path, engine='pyarrow', compression='zstd', index=False)
+
     def plot_variance(self):
         # Get the percentage of variance
         percentage_of_variance = self.ca.percentage_of_variance_
@@ -387,33 +655,34 @@ Attributes:
         plt.show()
 
     def get_unique_filepath(self, filepath):
-        import os
-
         # If the file doesn't exist, return the original filepath
         if not os.path.exists(filepath):
             return filepath
 
-        # If the file exists, ask the user if they want to overwrite it
-        overwrite = input(f"{filepath} already exists. Do you want to overwrite it? (yes/no): ")
-
-        if overwrite.lower() == 'yes':
+        # If the file exists, overwrite it or ask the user, depending on the overwrite policy
+        if self.overwrite_policy == 'overwrite':
             return filepath
+        if self.overwrite_policy == 'prompt':
+            overwrite = input(f"{filepath} already exists. Do you want to overwrite it? (yes/no): ")
+            if overwrite.lower() == 'yes':
+                return filepath
 
-        # If the user doesn't want to overwrite, add a unique suffix to the filename
+        # Otherwise add a suffix one higher than the highest one already used for this filename
         base, ext = os.path.splitext(filepath)
-        i = 1
-        while os.path.exists(filepath):
-            filepath = f"{base}_{i}{ext}"
-            i += 1
-
-        return filepath
+        suffix_pattern = re.compile(re.escape(base) + r'_(\d+)' + re.escape(ext) + '$')
+        used = [int(m.group(1)) for m in map(suffix_pattern.match, glob.glob(f"{glob.escape(base)}_*{glob.escape(ext)}")) if m]
+        return f"{base}_{max(used, default=0) + 1}{ext}"
     
 
-    def perform_ca_pipeline(self, save_path):
-        print("Creating contingency table...")
-        self.create_contingency_table()
+    def perform_ca_pipeline(self, save_path, n_components=8, n_iter=5, fmt='csv', engine='sparse'):
+        if engine == 'prince':
+            print("Creating contingency table...")
+            self.create_contingency_table()
+        else:
+            print("Creating incidence matrix...")
+            self.create_incidence_matrix()
         print("Performing CA analysis. Might take some time...")
-        self.perform_ca_analysis(save_path, n_components=100, n_iter=100)
+        self.perform_ca_analysis(save_path, n_components=n_components, n_iter=n_iter, fmt=fmt, engine=engine)
         print("Plotting variance...")
         self.plot_variance()
 
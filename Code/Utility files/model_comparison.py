@@ -1,9 +1,9 @@
+import hashlib
 import math
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
-from sklearn.metrics import mean_squared_error
 from sklearn.model_selection import GroupKFold, KFold
 import seaborn as sns
 import matplotlib.patches as mpatches
@@ -12,12 +12,216 @@ from scipy.stats import shapiro
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 import scipy
-from scipy.stats import spearmanr
+from scipy.linalg import cho_factor, cho_solve
+from scipy.stats import rankdata
 from sklearn.linear_model import RANSACRegressor
 from sklearn.linear_model import HuberRegressor
-from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.metrics import r2_score
 import statsmodels.api as sm
 
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, the cross-validation folds are then fitted in Python
+    njit = None
+
+
+def _wls_fit_fast(X, y, w):
+    """
+    Fit a weighted least squares model by solving the weighted normal equations.
+
+    Used in the cross-validation folds, where only the coefficients and the R2 of the
+    fit are needed. Falls back to np.linalg.lstsq when the Gram matrix is not positive definite.
+
+    Parameters:
+    X (np.ndarray): The design matrix, including the intercept column.
+    y (np.ndarray): The outcome values.
+    w (np.ndarray): The observation weights.
+
+    Returns:
+    tuple: (params, rsquared), with rsquared computed as statsmodels does for WLS with an intercept.
+    """
+    Xw_T = X.T * w
+    try:
+        params = cho_solve(cho_factor(Xw_T @ X), Xw_T @ y)
+    except np.linalg.LinAlgError:
+        sqrt_w = np.sqrt(w)
+        params = np.linalg.lstsq(X * sqrt_w[:, None], y * sqrt_w, rcond=None)[0]
+
+    ss_res = np.sum(w * (y - X @ params) ** 2)
+    ss_tot = np.sum(w * (y - np.average(y, weights=w)) ** 2)
+    return params, 1 - ss_res / ss_tot
+
+
+def _wls_fit_lite(X, y, w, cov_type='nonrobust'):
+    """
+    Fit a weighted least squares model and compute the statistics fit_wls reads, without statsmodels.
+
+    Parameters:
+    X (np.ndarray): The design matrix, including the intercept column.
+    y (np.ndarray): The outcome values.
+    w (np.ndarray): The observation weights.
+    cov_type (str, optional): 'nonrobust' (default) or 'HC3', as in statsmodels' WLS.fit.
+
+    Returns:
+    tuple: (params, pvalues, rsquared, aic, bic), matching the corresponding attributes of the statsmodels results.
+    """
+    n, k = X.shape
+    sqrt_w = np.sqrt(w)
+    Xw, yw = X * sqrt_w[:, None], y * sqrt_w
+    params = np.linalg.lstsq(Xw, yw, rcond=None)[0]
+    resid_w = yw - Xw @ params
+    ssr = resid_w @ resid_w
+    df_resid = n - k
+
+    # Covariance of the coefficients, with t based p-values for the classical covariance and normal ones for HC3
+    XtX_inv = np.linalg.pinv(Xw.T @ Xw)
+    if cov_type == 'nonrobust':
+        cov_params = XtX_inv * ssr / df_resid
+    elif cov_type == 'HC3':
+        leverage = np.einsum('ij,jk,ik->i', Xw, XtX_inv, Xw)
+        meat = (Xw * (resid_w / (1 - leverage))[:, None] ** 2).T @ Xw
+        cov_params = XtX_inv @ meat @ XtX_inv
+    else:
+        raise ValueError('Invalid cov_type. Expected "nonrobust" or "HC3".')
+    t_values = params / np.sqrt(np.diag(cov_params))
+    if cov_type == 'nonrobust':
+        pvalues = 2 * scipy.stats.t.sf(np.abs(t_values), df_resid)
+    else:
+        pvalues = 2 * scipy.stats.norm.sf(np.abs(t_values))
+
+    # Weighted R2 and the log-likelihood of the weighted model, as statsmodels computes them
+    rsquared = 1 - ssr / np.sum(w * (y - np.average(y, weights=w)) ** 2)
+    llf = -n / 2 * (np.log(2 * np.pi) + np.log(ssr / n) + 1) + np.sum(np.log(w)) / 2
+    aic = -2 * llf + 2 * k
+    bic = -2 * llf + np.log(n) * k
+    return params, pvalues, rsquared, aic, bic
+
+
+def _cv_folds(X, y, folds):
+    """
+    Fit the OLS-weighted WLS model on the training set of each fold and predict its test set.
+
+    Parameters:
+    X (np.ndarray): The design matrix, including the intercept column.
+    y (np.ndarray): The outcome values.
+    folds (list): (train_index, test_index) pairs, with every row in exactly one test set.
+
+    Returns:
+    tuple: (rmse, rsquared, predictions). rmse and rsquared hold one value per fold, and predictions
+           holds the out-of-fold prediction for every row.
+    """
+    rmse = np.empty(len(folds))
+    rsquared = np.empty(len(folds))
+    predictions = np.empty(len(y))
+
+    for k, (train_index, test_index) in enumerate(folds):
+        # Fit an OLS model on the training set to estimate weights
+        X_train = X[train_index]
+        y_train = y[train_index]
+        OLS_params = np.linalg.lstsq(X_train, y_train, rcond=None)[0]
+
+        # Calculate residuals for the training set
+        residuals_train = y_train - X_train @ OLS_params
+
+        # Estimate weights as the inverse of the squared residuals for the training set
+        weights_train = 1.0 / (residuals_train ** 2)
+
+        # Fit a WLS model on the training set using the estimated weights
+        wls_params, rsquared[k] = _wls_fit_fast(X_train, y_train, weights_train)
+
+        # Evaluate the model on the test set
+        predictions[test_index] = X[test_index] @ wls_params
+        rmse[k] = np.sqrt(np.mean((y[test_index] - predictions[test_index]) ** 2))
+
+    return rmse, rsquared, predictions
+
+
+# numba's np.linalg.lstsq keeps every nonzero singular value by default. Scaled by the largest dimension of the matrix,
+# this cutoff gives the rcond=None behaviour of numpy used in _cv_folds and _wls_fit_fast
+_LSTSQ_RCOND = np.finfo(np.float64).eps
+
+
+def _wls_params_kernel(X, y, w):
+    """
+    Numba version of the coefficients of _wls_fit_fast: a Cholesky solve of the weighted normal equations,
+    falling back to np.linalg.lstsq when the Gram matrix is not positive definite.
+    """
+    Xw_T = X.T * w
+    try:
+        L = np.linalg.cholesky(Xw_T @ X)
+        return np.linalg.solve(L.T, np.linalg.solve(L, Xw_T @ y))
+    except Exception:  # numba can only catch exceptions by their base class
+        sqrt_w = np.sqrt(w)
+        return np.linalg.lstsq(X * sqrt_w.reshape(-1, 1), y * sqrt_w, _LSTSQ_RCOND * max(X.shape))[0]
+
+
+# Compiled separately, as a try block inside the prange loop would keep numba from running the folds in parallel
+_wls_params_numba = njit(cache=True)(_wls_params_kernel) if njit is not None else None
+
+
+def _cv_folds_kernel(X, y, train_masks, test_masks):
+    """
+    Numba version of _cv_folds, running the folds in parallel. Folds are passed as boolean
+    (n_folds, n_rows) masks and the WLS coefficients come from _wls_params_kernel.
+    """
+    n_folds = train_masks.shape[0]
+    rmse = np.empty(n_folds)
+    rsquared = np.empty(n_folds)
+    predictions = np.empty(y.shape[0])
+
+    for k in prange(n_folds):
+        X_train = X[train_masks[k]]
+        y_train = y[train_masks[k]]
+        OLS_params = np.linalg.lstsq(X_train, y_train, _LSTSQ_RCOND * max(X_train.shape))[0]
+        weights_train = 1.0 / (y_train - X_train @ OLS_params) ** 2
+
+        wls_params = _wls_params_numba(X_train, y_train, weights_train)
+        y_mean = np.sum(weights_train * y_train) / np.sum(weights_train)
+        ss_res = np.sum(weights_train * (y_train - X_train @ wls_params) ** 2)
+        ss_tot = np.sum(weights_train * (y_train - y_mean) ** 2)
+        rsquared[k] = 1 - ss_res / ss_tot
+
+        test_index = np.flatnonzero(test_masks[k])
+        fold_predictions = X[test_index] @ wls_params
+        predictions[test_index] = fold_predictions
+        rmse[k] = np.sqrt(np.mean((y[test_index] - fold_predictions) ** 2))
+
+    return rmse, rsquared, predictions
+
+
+_cv_folds_numba = njit(parallel=True, cache=True)(_cv_folds_kernel) if njit is not None else None
+
+
+def _group_medians(values, codes, n_groups):
+    """
+    Compute the median of each column of values within each group.
+
+    The rows are sorted once per column by (group, value), after which the median of every
+    group is read off at the middle positions of its segment. NaN values are skipped, as in
+    DataFrame.groupby().median().
+
+    Parameters:
+    values (np.ndarray): A (n_rows, n_columns) float array.
+    codes (np.ndarray): The integer group id (0 to n_groups - 1) of every row.
+    n_groups (int): The number of groups.
+
+    Returns:
+    np.ndarray: A (n_groups, n_columns) array of medians, NaN for groups without values.
+    """
+    medians = np.full((n_groups, values.shape[1]), np.nan)
+    for j in range(values.shape[1]):
+        valid = ~np.isnan(values[:, j])
+        column, column_codes = values[valid, j], codes[valid]
+        order = np.lexsort((column, column_codes))
+        column = column[order]
+
+        counts = np.bincount(column_codes, minlength=n_groups)
+        starts = np.cumsum(counts) - counts
+        has_values = counts > 0
+        lower = column[(starts + (counts - 1) // 2)[has_values]]
+        upper = column[(starts + counts // 2)[has_values]]
+        medians[has_values, j] = (lower + upper) / 2
+    return medians
 
 
 class CrossValidation:
@@ -38,6 +242,11 @@ class CrossValidation:
         The column name of the outcome variable.
     n_splits : int, optional
         The number of splits for cross-validation, default is 10.
+    lite : bool, optional
+        If True, the full-sample WLS models are fitted with NumPy instead of statsmodels. The metrics are the same,
+        but no statsmodels results are kept, so print_summaries is unavailable. Default is False.
+    cov_type : str, optional
+        The covariance used for the p-values of the full-sample WLS models, 'nonrobust' (default) or 'HC3'.
     gkf : GroupKFold
         GroupKFold object for performing grouped cross-validation.
     results_values : dict
@@ -48,6 +257,8 @@ class CrossValidation:
         Dictionary to store residuals for each fold in cross-validation.
     predictions_dict : dict
         Dictionary to store predictions for each fold in cross-validation.
+    _splits_cache : dict
+        GroupKFold splits, keyed by a hash of the group labels they were computed from.
 
     Methods:
     -------
@@ -64,16 +275,19 @@ class CrossValidation:
     calculate_correlations_median(grouping_column):
         Calculates the correlation between predictors and the outcome, grouped by the specified column.
     """
-    def __init__(self, dfs, predictors, outcome, n_splits=10):
+    def __init__(self, dfs, predictors, outcome, n_splits=10, lite=False, cov_type='nonrobust'):
         self.dfs = dfs
         self.predictors = predictors
         self.outcome = outcome
         self.n_splits = n_splits
+        self.lite = lite
+        self.cov_type = cov_type
         self.gkf = GroupKFold(n_splits=n_splits)
         self.results_values = {}
         self.summary_outputs = []
         self.residuals_dict = {}
         self.predictions_dict = {}
+        self._splits_cache = {}
 
 
     def fit(self):
@@ -81,8 +295,9 @@ class CrossValidation:
         results_values = {}
 
         for i, df in enumerate(self.dfs, start=1):  # start=1 to make the index 1-based
-            r2_full, max_coeff_predictor, max_coeff_value, aic, bic, results_wls = self.fit_wls(df, i)
-            CV_rmse_mean, CV_r2_mean = self.cross_validation(df, i)
+            prepared = self._prepare(df)  # design matrix, outcome, weights and groups shared by both fits
+            r2_full, max_coeff_predictor, max_coeff_value, aic, bic, results_wls = self.fit_wls(df, i, prepared)
+            CV_rmse_mean, CV_r2_mean = self.cross_validation(df, i, prepared)
 
             # Store the metrics for the current DataFrame
             results_values[f'DataFrame {i}'] = (CV_rmse_mean, CV_r2_mean, r2_full, max_coeff_predictor, max_coeff_value, aic, bic)
@@ -100,24 +315,51 @@ class CrossValidation:
         print(f'Number of folds used: {self.n_splits}')
 
 
-    def fit_wls(self, df, i):
-        
-        #Fit the OLS model to obtain weights
-        X = sm.add_constant(df[self.predictors])  # Adding the intercept term
-        y = df[self.outcome]
-        model_OLS = sm.OLS(y, X)
-        OLS_results = model_OLS.fit()
-        OLS_residuals = y - OLS_results.predict(X) #redisudals on entire df
+    def _prepare(self, df):
+        """
+        Build the NumPy arrays used by fit_wls and cross_validation for one DataFrame.
+
+        Parameters:
+        df (pd.DataFrame): The DataFrame holding the predictors, the outcome and the 'PCS_ESE' groups.
+
+        Returns:
+        tuple: (X, y, weights, groups) as NumPy arrays. X includes the intercept column and weights are
+               the inverse squared residuals of an OLS fit on the entire DataFrame.
+        """
+        X = sm.add_constant(df[self.predictors]).to_numpy(dtype=float)  # Adding the intercept term
+        y = df[self.outcome].to_numpy(dtype=float)
+        OLS_params = np.linalg.lstsq(X, y, rcond=None)[0]
+        OLS_residuals = y - X @ OLS_params #residuals on entire df
         weights = 1.0 / (OLS_residuals ** 2) #weights inverse of residuals of entire df
+        groups = df['PCS_ESE'].to_numpy()
+        return X, y, weights, groups
+
+    def fit_wls(self, df, i, prepared=None):
+        
+        #Get the design matrix and the OLS based weights
+        X_np, y_np, weights, _ = prepared if prepared is not None else self._prepare(df)
+        X = pd.DataFrame(X_np, index=df.index, columns=['const'] + self.predictors)
+        y = pd.Series(y_np, index=df.index, name=self.outcome)
         
 
         # Fit a WLS model on the entire DataFrame using the estimated weights
-        model_wls = sm.WLS(y, X, weights=weights)
-        results_wls = model_wls.fit()  
-        p_values = results_wls.pvalues
+        if self.lite:
+            params, p_values, r2_full, aic, bic = _wls_fit_lite(X_np, y_np, weights, self.cov_type)
+            coefficients = pd.Series(params, index=X.columns)
+            p_values = pd.Series(p_values, index=X.columns)
+            results_wls = None
+        else:
+            model_wls = sm.WLS(y, X, weights=weights)
+            results_wls = model_wls.fit(cov_type=self.cov_type)
+            coefficients = results_wls.params
+            p_values = results_wls.pvalues
+
+            # Calculate R2 for the entire DataFrame, and get AIC and BIC of the model
+            r2_full = results_wls.rsquared
+            aic = results_wls.aic
+            bic = results_wls.bic
 
         # Obtain largest absoulte significant coefficients
-        coefficients = results_wls.params
         significant_coefficients = coefficients[p_values < 0.05]
 
         if 'const' in significant_coefficients:
@@ -126,58 +368,48 @@ class CrossValidation:
         max_coeff_predictor = significant_coefficients.abs().idxmax()
         max_coeff_value = significant_coefficients[max_coeff_predictor]
 
-        # Calculate R2 for the entire DataFrame
-        r2_full = results_wls.rsquared
-
-        #Get the summary output
-        summary = results_wls.summary()
-
-        # Get AIC and BIC of the model
-        aic = results_wls.aic
-        bic = results_wls.bic
-
         return r2_full, max_coeff_predictor, max_coeff_value, aic, bic, results_wls
     
     def print_summaries(self):
+        if self.lite:
+            raise ValueError("Summaries are not available for models fitted with lite=True.")
         for df_number, results_wls in self.results_wls_dict.items():
             print(f"Summary for DataFrame {df_number}:")
             print(results_wls.summary())
 
-    def cross_validation(self, df, i):
-        CV_rmse_scores = [] 
-        CV_r2_scores = []  
-        X = sm.add_constant(df[self.predictors])  # Adding the intercept term
-        y = df[self.outcome]
+    def _splits(self, groups):
+        """
+        Return the GroupKFold (train_index, test_index) pairs for the given groups.
+
+        The splits only depend on the group labels, so they are computed once per distinct set of
+        groups and reused by later calls, including calls for other DataFrames with the same groups.
+        """
+        key = hashlib.sha1(pd.util.hash_array(groups)).hexdigest()
+        if key not in self._splits_cache:
+            # GroupKFold only reads the groups, so an empty placeholder with the right number of rows stands in for X
+            self._splits_cache[key] = list(self.gkf.split(np.empty((len(groups), 0)), groups=groups))
+        return self._splits_cache[key]
+
+    def cross_validation(self, df, i, prepared=None):
+        X, y, _, groups = prepared if prepared is not None else self._prepare(df)
         self.predictions_dict = {}
-
-        for fold, (train_index, test_index) in enumerate(self.gkf.split(df[self.predictors], df[self.outcome], df['PCS_ESE']), start=1):
-            # Split the data into training and test sets
-            train, test = df.iloc[train_index], df.iloc[test_index]
-
-            # Fit an OLS model on the training set to estimate weights
-            X_train = X.iloc[train_index]
-            y_train = y.iloc[train_index]
-            OLS_model = sm.OLS(y_train, X_train)
-            OLS_results = OLS_model.fit()
-
-            # Calculate residuals for the training set
-            residuals_train = y_train - OLS_results.predict(X_train)
-
-            # Estimate weights as the inverse of the squared residuals for the training set
-            weights_train = 1.0 / (residuals_train ** 2)
-
-            # Fit a WLS model on the training set using the estimated weights
-            model_wls = sm.WLS(y_train, X_train, weights=weights_train)
-            results_wls = model_wls.fit()
-
-            # Evaluate the model on the test set
-            X_test = X.iloc[test_index]
-            y_test = y.iloc[test_index]
-            predictions = results_wls.predict(X_test)
-            mse = mean_squared_error(y_test, predictions)
-            rmse = np.sqrt(mse)  # Calculate RMSE
-            CV_rmse_scores.append(rmse)
-            CV_r2_scores.append(results_wls.rsquared)
+        folds = self._splits(groups)
+
+        # Fit the folds, in parallel with the compiled kernel when numba is installed
+        if _cv_folds_numba is not None:
+            train_masks = np.zeros((len(folds), len(y)), dtype=bool)
+            test_masks = np.zeros((len(folds), len(y)), dtype=bool)
+            for k, (train_index, test_index) in enumerate(folds):
+                train_masks[k, train_index] = True
+                test_masks[k, test_index] = True
+            CV_rmse_scores, CV_r2_scores, fold_predictions = _cv_folds_numba(X, y, train_masks, test_masks)
+        else:
+            CV_rmse_scores, CV_r2_scores, fold_predictions = _cv_folds(X, y, folds)
+
+        for fold, (_, test_index) in enumerate(folds, start=1):
+            test_labels = df.index[test_index]
+            y_test = pd.Series(y[test_index], index=test_labels, name=self.outcome)
+            predictions = pd.Series(fold_predictions[test_index], index=test_labels)
 
             # Store residuals and predictions for this fold
             residuals_fold = y_test - predictions
@@ -198,14 +430,12 @@ class CrossValidation:
         if not self.residuals_dict:
             raise ValueError("residuals_dict is empty or not properly populated.")
 
-        # Aggregate residuals by model
-        model_residuals = {}
+        # Aggregate residuals by model, collecting the folds first and concatenating once per model
+        fold_residuals = {}
         for key, residuals in self.residuals_dict.items():
             model_name = key.split('_')[0]  # Assuming the model name is the first part of the key
-            if model_name not in model_residuals:
-                model_residuals[model_name] = residuals
-            else:
-                model_residuals[model_name] = pd.concat([model_residuals[model_name], residuals])
+            fold_residuals.setdefault(model_name, []).append(residuals)
+        model_residuals = {model_name: pd.concat(residuals) for model_name, residuals in fold_residuals.items()}
 
         num_models = len(model_residuals)
         num_cols = 3
@@ -228,21 +458,27 @@ class CrossValidation:
     def calculate_correlations_median(self, grouping_column):
         correlations = {}
         for i, df in enumerate(self.dfs, start=1):
-            # Select only required columns
-            df = df[self.predictors + [self.outcome, grouping_column]]
             # Group by grouping_column and calculate median coordinates
-            df_grouped = df.groupby(grouping_column).median()
-
-            if len(self.predictors) == 1:
-                # If there's only one predictor, calculate the correlation and p-value directly
-                corr_value, p_value = spearmanr(df_grouped[self.predictors[0]], df_grouped[self.outcome])
-                corr_values = pd.Series([corr_value], index=self.predictors)
-                p_values = pd.Series([p_value], index=self.predictors)
-            else:
-                # Calculate correlation with outcome for each predictor
-                corr_values, p_values = spearmanr(df_grouped)
-                corr_values = pd.Series(corr_values[-1, :-1], index=self.predictors)
-                p_values = pd.Series(p_values[-1, :-1], index=self.predictors)
+            codes, uniques = pd.factorize(df[grouping_column])
+            has_group = codes >= 0  # rows with a missing group are dropped, as in groupby
+            values = df.loc[has_group, self.predictors + [self.outcome]].to_numpy(dtype=float)
+            medians = _group_medians(values, codes[has_group], len(uniques))
+
+            # Spearman correlation of each predictor with the outcome: rank the medians and correlate them in one call
+            ranks = rankdata(medians, axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                corr_values = np.corrcoef(ranks, rowvar=False)[-1, :-1]
+                dof = len(medians) - 2
+                t_values = corr_values * np.sqrt((dof / ((corr_values + 1.0) * (1.0 - corr_values))).clip(0))
+            p_values = 2 * scipy.stats.t.sf(np.abs(t_values), dof)
+
+            # A missing group median makes the correlations involving that column undefined
+            column_has_nan = np.isnan(medians).any(axis=0)
+            undefined = column_has_nan[:-1] | column_has_nan[-1]
+            corr_values[undefined] = np.nan
+            p_values[undefined] = np.nan
+            corr_values = pd.Series(corr_values, index=self.predictors)
+            p_values = pd.Series(p_values, index=self.predictors)
 
             # Get predictor with highest absolute correlation
             max_corr_predictor = corr_values.abs().idxmax()
@@ -13,8 +13,9 @@ from nltk.tokenize import word_tokenize
 from nltk.util import ngrams
 import numpy as np  # Duplicate import, kept only one
 import pandas as pd
-from joblib import Parallel, delayed
-from langdetect import detect, detect_langs, DetectorFactory, LangDetectException
+from joblib import Parallel, delayed, effective_n_jobs
+from langdetect import DetectorFactory, LangDetectException
+from langdetect.detector_factory import PROFILES_DIRECTORY
 import regex
 from scipy.stats import zscore
 from unidecode import unidecode
@@ -79,13 +80,17 @@ def summary_stats(df, print_dtypes=True):
     subset = [col for col in subset_columns if col in df.columns]
     
     for col in subset:
-        print(f"\nNumber of unique values in '{col}': ", df[col].nunique())
-        duplicates = df[col].duplicated().sum()
+        # One hash of the column gives both counts: the unique non-missing values, and the rows repeating an earlier value.
+        # Unused categories of categorical columns are listed with a zero count, so they are dropped first
+        value_counts = df[col].value_counts(dropna=False)
+        value_counts = value_counts[value_counts > 0]
+        print(f"\nNumber of unique values in '{col}': ", value_counts.index.notna().sum())
+        duplicates = len(df) - len(value_counts)
         print(f"Number of duplicate values in '{col}': ", duplicates)
     
     print("\nNumber of missing values in each column:")
-    for col in df.columns:
-        print(f"'{col}': ", df[col].isnull().sum())
+    for col, missing in df.isnull().sum().items():
+        print(f"'{col}': ", missing)
     
     print("\nNumber of duplicate rows: ", df.duplicated().sum())
 
@@ -101,11 +106,12 @@ def compare_column_values(df1, df2, column):
     - The number of unique values in df1 that don't exist in df2.
     - The number of unique values in df2 that don't exist in df1.
     """
-    missing_in_df1 = df1.loc[~df1[column].isin(df2[column]), column]
-    missing_in_df2 = df2.loc[~df2[column].isin(df1[column]), column]
+    # Set differences of the unique (non-missing) values, without filtering either DataFrame
+    unique_df1 = pd.Index(df1[column].dropna().unique())
+    unique_df2 = pd.Index(df2[column].dropna().unique())
     
-    print(f"There are {missing_in_df1.nunique()} unique values in df1 that don't exist in df2.")
-    print(f"There are {missing_in_df2.nunique()} unique values in df2 that don't exist in df1.")
+    print(f"There are {unique_df1.difference(unique_df2, sort=False).size} unique values in df1 that don't exist in df2.")
+    print(f"There are {unique_df2.difference(unique_df1, sort=False).size} unique values in df2 that don't exist in df1.")
 
 
 def calculate_language_percentages(df, column):
@@ -179,13 +185,19 @@ def location_bio_stats(df):
         percentage = calculate_percentage(count, total_rows)
         print(f'{name}: {count} ({percentage})')
     
+    # Compute the missing value masks once, the other counts are derived from them
+    has_location = df['location'].notna().to_numpy()
+    has_bio = df['description_cleantext'].notna().to_numpy()
+    location_count = has_location.sum()
+    bio_count = has_bio.sum()
+
     # Calculate and print each statistic
     print_stat('Unique locations', df['location'].nunique())
-    print_stat('Users with location data', df['location'].notna().sum())
-    print_stat('Users without location data', df['location'].isna().sum())
-    print_stat('Users with bios', df['description_cleantext'].notna().sum())
-    print_stat('Users without bios', df['description_cleantext'].isna().sum())
-    print_stat('Users with both location and bios', df[(df['location'].notna()) & (df['description_cleantext'].notna())].shape[0])
+    print_stat('Users with location data', location_count)
+    print_stat('Users without location data', total_rows - location_count)
+    print_stat('Users with bios', bio_count)
+    print_stat('Users without bios', total_rows - bio_count)
+    print_stat('Users with both location and bios', (has_location & has_bio).sum())
 
 # -------------------
 # Data wrangling functions
@@ -208,28 +220,29 @@ def assign_country(location, city_names):
                 return 'France'
     return 'Other'
 
-def filter_add_jobs_coords(file_number, jobdf):
+def filter_add_jobs_coords(file_number, jobdf, fmt='csv'):
     """
     Adds coordinates from the CA files to the job title file
     
     Parameters:
     - file_number (int): The file number to construct the file path for coordinates data.
     - jobdf (DataFrame): The DataFrame containing job data to be merged with coordinates.
+    - fmt (str, optional): File format of the coordinates file that is read and of the file that is saved, 'csv' (default) or 'parquet'.
     
     Returns:
     - DataFrame: The merged DataFrame containing job data with added coordinates.
     
     Performs several steps:
-    - Reads coordinates data from a CSV file based on the provided file number.
+    - Reads coordinates data from a CSV (or parquet) file based on the provided file number.
     - Filters the coordinates data to include only those present in the jobdf DataFrame.
     - Merges the filtered coordinates data with the job data.
     - Strips leading and trailing spaces from the 'title' column.
     - Checks if the output directory exists, creates it if not.
-    - Saves the merged DataFrame to a CSV file in the specified directory.
+    - Saves the merged DataFrame to a CSV (or parquet) file in the specified directory.
     """
     file_path = f"/home/livtollanes/NewData/coordinates/m{file_number}_coords/m{file_number}_row_coordinates.csv"
     print(f"Used file path: {file_path}") 
-    df = pd.read_csv(file_path, sep = ',', dtype={'follower_id': str})
+    df = _read_table(file_path, dtype={'follower_id': str}, fmt=fmt)
 
     # Filter df based on jobdf
     comparison_ids = jobdf['follower_id'].unique()
@@ -248,9 +261,12 @@ def filter_add_jobs_coords(file_number, jobdf):
         os.makedirs(directory)
         print(f"Constructed job coord path: {directory}")
     
-    # Save df to CSV file in directory
-    output_file_path = f"{directory}/m{file_number}_jobs_rowcoords.csv"
-    df.to_csv(output_file_path, sep = ',', index = False)
+    # Save df to CSV (or parquet) file in directory
+    output_file_path = f"{directory}/m{file_number}_jobs_rowcoords.{fmt}"
+    if fmt == 'parquet':
+        df.to_parquet(output_file_path, engine='pyarrow', compression='zstd', index=False)
+    else:
+        df.to_csv(output_file_path, sep = ',', index = False)
 
     return df
 
@@ -271,24 +287,30 @@ def filter_followers(df, follower_id_column, min_brands):
     Returns:
     pandas.DataFrame: The filtered DataFrame.
     """
-    # Count the number of brands each follower is following
-    follower_brand_counts = df.groupby(follower_id_column)['marker_id'].nunique()
-
-    # Get the follower_ids of the followers who are following at least 'min_brands' brands
-    valid_followers = follower_brand_counts[follower_brand_counts >= min_brands].index
+    # Count the number of brands each follower is following: sort the unique (follower, marker) code pairs once and count them per follower.
+    # Followers and markers that are missing get the code -1 and are left out, as in groupby().nunique()
+    follower_codes, followers = pd.factorize(df[follower_id_column])
+    marker_codes, markers = pd.factorize(df['marker_id'])
+    has_follower = follower_codes >= 0
+    has_pair = has_follower & (marker_codes >= 0)
+    pairs = np.unique(follower_codes[has_pair].astype(np.int64) * len(markers) + marker_codes[has_pair])
+    brand_counts = np.bincount(pairs // max(len(markers), 1), minlength=len(followers))
+
+    # Get the followers who are following at least 'min_brands' brands
+    is_valid = brand_counts >= min_brands
 
     # Calculate the number and percentage of followers who follow less than 'min_brands' brands
-    invalid_followers_count = len(follower_brand_counts) - len(valid_followers)
-    invalid_followers_percentage = (invalid_followers_count / len(follower_brand_counts)) * 100
+    invalid_followers_count = len(followers) - is_valid.sum()
+    invalid_followers_percentage = (invalid_followers_count / len(followers)) * 100
 
     print(f"{invalid_followers_count} followers follow less than {min_brands} brands ({invalid_followers_percentage:.2f}% of the total followers).")
 
-    # Filter the DataFrame to only include the valid followers
-    filtered_df = df[df[follower_id_column].isin(valid_followers)]
+    # Filter the DataFrame to only include the valid followers, looking each row up by its follower code
+    filtered_df = df[has_follower & is_valid[follower_codes]]
 
     # Calculate the number and percentage of followers left after the filtering
-    valid_followers_count = len(filtered_df[follower_id_column].unique())
-    valid_followers_percentage = (valid_followers_count / len(follower_brand_counts)) * 100
+    valid_followers_count = is_valid.sum()
+    valid_followers_percentage = (valid_followers_count / len(followers)) * 100
 
     print(f"After removing these followers, {valid_followers_count} followers are left ({valid_followers_percentage:.2f}% of the followers in the inputted df).")
     
@@ -312,15 +334,31 @@ def streamline_IDs(source, df_tofilter, column):
     The number of rows removed and the number of rows left in the filtered DataFrame.
     """
     initial_rows = len(df_tofilter)
-    
-    # Filter df_tofilter to only include rows where column value is in source
-    df_tofilter_filtered = df_tofilter[df_tofilter[column].isin(source[column])]
+
+    # Unique source values, computed once and used both for filtering and for the printout (a missing value is kept as one of them)
+    _, source_values = pd.factorize(source[column], use_na_sentinel=False)
+
+    # Filter df_tofilter to only include rows where column value is in source, via the position of each value among the source values
+    values = df_tofilter[column]
+    positions = source_values.get_indexer(values)
+    found = positions >= 0
+    # Missing values are matched with isin, like the other values were before: it keeps None, NaN and NaT apart,
+    # while factorize merges them into a single missing source value
+    if source_values.hasnans:
+        missing = values.isna().to_numpy()
+        source_missing = source[column][source[column].isna()]
+        found[missing] = values[missing].isin(source_missing).to_numpy()
+    df_tofilter_filtered = df_tofilter[found]
     
     final_rows = len(df_tofilter_filtered)
 
+    # Flag the source values that occur in the filtered DataFrame, by position, which avoids sorting the positions
+    is_present = np.zeros(len(source_values), dtype=bool)
+    is_present[positions[found & (positions >= 0)]] = True
+
     # Print the number of unique values in each DataFrame
-    print(f"Number of unique {column} in source DataFrame: {source[column].nunique()}")
-    print(f"Number of unique {column} in filtered DataFrame after filtering: {df_tofilter_filtered[column].nunique()}")
+    print(f"Number of unique {column} in source DataFrame: {source_values.notna().sum()}")
+    print(f"Number of unique {column} in filtered DataFrame after filtering: {source_values[is_present].notna().sum()}")
     
     # Print the number of rows removed and left
     print(f"Removed {initial_rows - final_rows} rows from the DataFrame to be filtered.")
@@ -372,10 +410,11 @@ def min_french_followers(df, min_followers):
              including their Twitter name, marker followers, French followers, and type.
     """
     # Filter rows with 'french_followers' less than min_followers
-    filtered_df = df[df['french_followers'] >= min_followers]
+    keep = df['french_followers'] >= min_followers
+    filtered_df = df[keep]
 
-    # Find the rows that were removed
-    removed_rows = df.loc[~df.index.isin(filtered_df.index)]
+    # The removed rows are the complement of the same mask (including rows where 'french_followers' is missing)
+    removed_rows = df[~keep]
 
     # Get the 'twitter_name' and 'french_followers' columns of the removed rows
     removed_info = removed_rows[['twitter_name', 'marker_followers','french_followers', 'type']]
@@ -383,8 +422,8 @@ def min_french_followers(df, min_followers):
     # Remove duplicate 'twitter_name' rows
     removed_info = removed_info.drop_duplicates(subset='twitter_name')
 
-    # Print the total number of brands removed
-    print(f"Total brands removed: {removed_info['twitter_name'].nunique()}")
+    # Print the total number of brands removed. The names are unique after drop_duplicates, so only missing names need excluding
+    print(f"Total brands removed: {removed_info['twitter_name'].notna().sum()}")
 
     return filtered_df, removed_info
 
@@ -393,14 +432,52 @@ def min_french_followers(df, min_followers):
 # Bio processing, language detection, and other text-related functions
 # -------------------
 
-def _remove_emoji(string):
-    return emoji.demojize(string, delimiters=("<EMOJI:", ">"))
+# Emojis, matched by their Unicode properties, and keycap sequences (#, * or a digit followed by the combining keycap), 
+# whose first character is not an emoji on its own. Emoji components left over (ZWJ, skin tones, tags) are removed by
+# _ALLOWED_RE further on
+_EMOJI_RE = regex.compile(r'[#*0-9]\uFE0F?\u20E3|[\p{Emoji_Presentation}\p{Extended_Pictographic}]+')
+
+# Variation selectors that are not part of a matched emoji sequence
+_VARIATION_SELECTOR_RE = re.compile(r'[\uFE0E\uFE0F]+')
+
+# Characters removed from bios: everything that is not a letter, number, punctuation, separator or
+# currency symbol, and everything outside the Basic Multilingual Plane
+_ALLOWED_RE = regex.compile(r'[^\p{L}\p{N}\p{P}\p{Z}\p{Sc}«»€]')
+_BMP_RE = regex.compile(r'[\U00010000-\U0010FFFF]+')  # whole runs are removed in one substitution
+_EMOJI_DESC_RE = re.compile(r'<EMOJI:.*?>')
+
+# The ASCII characters removed by _ALLOWED_RE (control characters and the symbols +<=>^`|~) as a plain character class,
+# which the re module checks faster than the Unicode property classes
+_ASCII_DISALLOWED_RE = re.compile('[' + re.escape(''.join(c for c in map(chr, range(128)) if _ALLOWED_RE.match(c))) + ']+')
+
+def _process_bio(bio):
+    # Emojis, characters changed by NFKC and characters outside the BMP are all non-ASCII,
+    # so pure ASCII bios (the majority) only need the two remaining filters
+    if bio.isascii():
+        return _ASCII_DISALLOWED_RE.sub('', _EMOJI_DESC_RE.sub('', bio))
+
+    # Each emoji is replaced by '>', the closing delimiter of the <EMOJI:...> tags that emoji.demojize used to insert. Like a tag,
+    # it closes an '<EMOJI:' typed in the bio and keeps NFKC from composing characters across the emoji, and it is removed
+    # with the other disallowed characters later on. Leftover variation selectors are dropped, as demojize does.
+    # NFKC would merge '>' with a following U+0338, so the rare bios containing U+0338 are still demojized
+    if '\u0338' in bio:
+        bio = emoji.demojize(bio, delimiters=("<EMOJI:", ">"))
+    else:
+        bio = _VARIATION_SELECTOR_RE.sub('', _EMOJI_RE.sub('>', bio))
+    bio = unicodedata.normalize('NFKC', bio)
+    bio = _EMOJI_DESC_RE.sub('', bio)
+    bio = _ALLOWED_RE.sub('', bio)
+    bio = _BMP_RE.sub('', bio)
+    return bio
 
-def _remove_emoji_descriptions(string):
-    return re.sub(r'<EMOJI:.*?>', '', string)
+def _process_bios(bios):
+    # Works on a plain array of strings, so that chunks sent to worker processes pickle cheaply
+    return [_process_bio(bio) for bio in bios]
 
+# Below this number of rows, starting worker processes costs more than it saves
+MIN_LINES_FOR_PARALLELIZATION = 10000
 
-def process_description(df, column):
+def process_description(df, column, n_jobs=-1):
     """
     Process a column of a DataFrame.
     Removes emojis, special characters and unusual fonts, fixes text issues while preserving accents.
@@ -408,62 +485,254 @@ def process_description(df, column):
     Parameters:
     df (DataFrame): The DataFrame to process.
     column (str): The name of the column to process.
+    n_jobs (int, optional): The number of CPU cores to use. -1 means using all processors. 
+                            DataFrames with fewer than MIN_LINES_FOR_PARALLELIZATION rows are always processed in a single process.
 
     Returns:
-    DataFrame: The processed DataFrame.
-    """
-    df = df.copy()
-    def process_bio(bio):
-        if pd.notnull(bio):
-            bio = _remove_emoji(bio)
-            bio = unicodedata.normalize('NFKC', bio)
-            bio = _remove_emoji_descriptions(bio)
-            bio = regex.sub(r'[^\p{L}\p{N}\p{P}\p{Z}\p{Sc}«»€]', '', bio)
-            bio = ''.join(c for c in bio if c <= '\uFFFF')
-        else:
-            bio = ''
-        return bio
+    DataFrame: A copy of df with the cleaned text added in the column '<column>_cleantext'. The input DataFrame is left unchanged.
+    """
+    # Only the new column is added, so a shallow copy is enough to leave the input DataFrame untouched
+    df = df.copy(deep=False)
+
+    # Missing bios become empty strings. Bios are often repeated (empty, default or copy-pasted), so each distinct bio is cleaned only once
+    codes, bios = pd.factorize(df[column].fillna(''))
+    bios = np.asarray(bios, dtype=object)
 
-    df.loc[:, column + '_cleantext'] = df[column].apply(process_bio)
+    n_workers = effective_n_jobs(n_jobs)
+    if n_workers == 1 or len(bios) < MIN_LINES_FOR_PARALLELIZATION:
+        cleaned = _process_bios(bios)
+    else:
+        # Split the distinct bios into one contiguous chunk per worker and clean the chunks in separate processes
+        chunks = np.array_split(bios, n_workers)
+        results = Parallel(n_jobs=n_workers, backend='loky')(delayed(_process_bios)(chunk) for chunk in chunks)
+        cleaned = [bio for chunk in results for bio in chunk]
+
+    # Scatter the cleaned bios back to their rows. The column is replaced rather than written into with .loc, as an existing
+    # '<column>_cleantext' column still shares its data with the input DataFrame after the shallow copy
+    df[column + '_cleantext'] = pd.Series(cleaned).take(codes).set_axis(df.index)
     return df
 
-def _detect_language(bio):
+# Fast path settings for _detect_language: bios shorter than this or with fewer letters than this are not sent to the detector,
+# and ASCII-only bios with at least two of these English function words (none of them common in French) are labelled 'en'
+MIN_DETECTABLE_LENGTH = 10
+MIN_DETECTABLE_LETTERS = 3
+_EN_STOPWORDS = {'the', 'and', 'of', 'to', 'is', 'my', 'with', 'for', 'you', 'your', 'this', 'that', 'are', 'be',
+                 'from', 'we', 'our', 'it', 'at', 'in', 'by', 'who', 'about', 'all', 'was', 'have', 'has', 'not'}
+_ASCII_RE = re.compile(r'^[\x00-\x7F]+$')
+
+# Language profiles loaded into langdetect when add_and_detect_language is called with reduced_profiles=True.
+# Detection time and memory grow with the number of loaded profiles, so only the most common languages are kept. Extend as needed
+LANGDETECT_LANGUAGES = ['en', 'es', 'fr', 'de', 'it', 'pt', 'ru', 'ja', 'ko', 'zh-cn', 'zh-tw', 'ar', 'hi', 'bn', 'id']
+
+def _check_langdetect_languages(languages):
+    """
+    Check a list of langdetect language codes before their profiles are loaded.
+
+    Parameters:
+    languages (list): The language codes, e.g. ['fr', 'en'].
+
+    Returns:
+    list: The codes without duplicates, in their original order.
+
+    Raises:
+    ValueError: If a code has no langdetect profile, or if fewer than two distinct codes are given, which langdetect cannot load.
+    """
+    languages = list(dict.fromkeys(languages))
+    available = sorted(os.listdir(PROFILES_DIRECTORY))  # one profile file per language, named by its code
+    unknown = [lang for lang in languages if lang not in available]
+    if unknown:
+        raise ValueError(f"Unknown langdetect language codes: {unknown}. Expected codes from {available}.")
+    if len(languages) < 2:
+        raise ValueError(f"langdetect needs at least two language profiles, got {languages}.")
+    return languages
+
+# The langdetect factory of this process and the languages it holds, None meaning all of its profiles.
+# It is kept here rather than in langdetect's module level factory, so that detect and detect_langs are left untouched
+_langdetect_factory = None
+_loaded_languages = None
+
+def _load_langdetect_profiles(languages=None, seed=None):
+    """
+    Load langdetect's language profiles, once per process, and return the detector factory.
+
+    Parameters:
+    languages (list, optional): The language profiles to load, at least two. None loads all the profiles shipped with langdetect.
+    seed (int, optional): The seed of the detectors created by the factory.
+
+    Returns:
+    DetectorFactory: The factory holding the loaded profiles.
+
+    Raises:
+    ValueError: If languages holds an unknown code or fewer than two distinct codes, see _check_langdetect_languages.
+    """
+    global _langdetect_factory, _loaded_languages
+    languages = tuple(languages) if languages is not None else None
+    if _langdetect_factory is None or languages != _loaded_languages:
+        factory = DetectorFactory()
+        if languages is None:
+            factory.load_profile(PROFILES_DIRECTORY)
+        else:
+            # Only checked when the profiles are (re)loaded, as this function runs for every bio
+            profiles = []
+            for lang in _check_langdetect_languages(languages):
+                with open(os.path.join(PROFILES_DIRECTORY, lang), encoding='utf-8') as f:
+                    profiles.append(f.read())
+            factory.load_json_profile(profiles)
+        _langdetect_factory = factory
+        _loaded_languages = languages
+
+    # The seed is set on this factory only, not on the DetectorFactory class, and reaches worker processes through the call arguments
+    _langdetect_factory.seed = seed
+    return _langdetect_factory
+
+def _detect_language(bio, fast_path=False, languages=None, seed=None):
     """
     Detect the language of a string using the langdetect library.
 
     Parameters:
     bio (str): The string to process.
+    fast_path (bool, optional): If True, bios shorter than MIN_DETECTABLE_LENGTH characters or with fewer than MIN_DETECTABLE_LETTERS 
+                                letters (numbers, symbols, emojis) are labelled 'unknown' and 
+                                ASCII-only bios with at least two English function words are labelled 'en', both without running langdetect.
+    languages (list, optional): The language profiles to detect from. None uses all the profiles shipped with langdetect.
+    seed (int, optional): The seed for the language detection algorithm.
 
     Returns:
     str: The language of the string, or 'unknown' if the language could not be detected or if the input is not a string.
     """
     if pd.isna(bio) or bio.strip() == '':
         return 'unknown'
+    if fast_path:
+        stripped = bio.strip()
+        if len(stripped) < MIN_DETECTABLE_LENGTH or sum(map(str.isalpha, stripped)) < MIN_DETECTABLE_LETTERS:
+            return 'unknown'
+        if _ASCII_RE.match(stripped) and len(_EN_STOPWORDS.intersection(stripped.lower().split())) >= 2:
+            return 'en'
+    # The factory is loaded once per process and creates a lightweight detector for each bio
+    factory = _load_langdetect_profiles(languages, seed)
     try:
-        detected_languages = detect_langs(bio)
+        detector = factory.create()
+        detector.append(bio)
+        detected_languages = detector.get_probabilities()
         # The first language in the list is the most probable
         most_probable_language = detected_languages[0]
         return str(most_probable_language.lang)
     except LangDetectException:
         return 'unknown'
 
-def add_and_detect_language(df, column, seed=3, n_jobs=-1):
+def _detect_languages(bios, fast_path=False, languages=None, seed=None):
+    # Detects a whole chunk of bios per task, so that the profiles are loaded and the bios pickled once per chunk
+    return [_detect_language(bio, fast_path, languages, seed) for bio in bios]
+
+# The lingua detector is only built on first use, as preloading all language models takes a few seconds
+_LINGUA_DETECTOR = None
+
+def _get_lingua_detector():
+    global _LINGUA_DETECTOR
+    if _LINGUA_DETECTOR is None:
+        from lingua import LanguageDetectorBuilder  # optional dependency (lingua-language-detector)
+        _LINGUA_DETECTOR = LanguageDetectorBuilder.from_all_languages().with_preloaded_language_models().build()
+    return _LINGUA_DETECTOR
+
+def _lingua_to_iso(language):
+    # lingua returns None when no language could be detected
+    if language is None:
+        return 'unknown'
+    return language.iso_code_639_1.name.lower()
+
+# Path to fastText's language identification model, downloadable from
+# https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.bin
+FASTTEXT_MODEL_PATH = 'lid.176.bin'
+
+# The fastText model is only loaded on first use, like the lingua detector
+_FASTTEXT_MODEL = None
+
+def _get_fasttext_model():
+    global _FASTTEXT_MODEL
+    if _FASTTEXT_MODEL is None:
+        import fasttext  # optional dependency (fasttext or fasttext-wheel)
+        _FASTTEXT_MODEL = fasttext.load_model(FASTTEXT_MODEL_PATH)
+    return _FASTTEXT_MODEL
+
+def _detect_languages_fasttext(bios):
+    """
+    Detect the language of a list of strings using fastText's lid.176 model.
+
+    Parameters:
+    bios (list): The strings to process.
+
+    Returns:
+    list: The ISO 639 code of the most probable language of each string, or 'unknown' if no language was predicted.
+    """
+    # fastText predicts a whole list of texts in one call, but does not accept newlines within a text
+    labels, _ = _get_fasttext_model().predict([bio.replace('\n', ' ') for bio in bios], k=1)
+    return [label[0].replace('__label__', '') if len(label) else 'unknown' for label in labels]
+
+def add_and_detect_language(df, column, seed=3, n_jobs=-1, backend='langdetect', fast_path=False, reduced_profiles=False):
     """
     Add a language column to a DataFrame and detect the language for each row.
 
     Parameters:
     df (DataFrame): The DataFrame to process.
     column (str): The column to detect language from.
-    seed (int): The seed for the language detection algorithm.
-    n_jobs (int): The number of CPU cores to use. -1 means using all processors.
+    seed (int): The seed for the language detection algorithm. Only used by the langdetect backend.
+    n_jobs (int): The number of CPU cores to use. -1 means using all processors. Only used by the langdetect backend.
+    backend (str, optional): 'langdetect' (default), 'lingua' or 'fasttext'. The lingua backend is much faster, but requires the
+                             lingua-language-detector package and may label some bios differently than langdetect.
+                             The fasttext backend is the fastest, and requires the fasttext package and the model file 
+                             at FASTTEXT_MODEL_PATH. Its labels also differ from langdetect's (e.g. 'zh' instead of 'zh-cn').
+    fast_path (bool, optional): If True, very short and clearly English bios are labelled without running langdetect. 
+                                Off by default, as it changes the labels of short bios. Only used by the langdetect backend.
+    reduced_profiles (bool or list, optional): If True, langdetect only scores the languages in LANGDETECT_LANGUAGES, which uses less memory 
+                                               and speeds up detection. A list of langdetect language codes (e.g. ['fr', 'en']) restricts 
+                                               detection to those languages instead. Bios in other languages are then labelled with the 
+                                               closest loaded language. langdetect needs at least two distinct languages, a shorter 
+                                               list or an unknown code raises a ValueError.
 
     Returns:
-    DataFrame: The DataFrame with the added language column.
+    DataFrame: The DataFrame with the added language column, of categorical dtype.
     """
-    DetectorFactory.seed = seed
-    df['language'] = Parallel(n_jobs=n_jobs)(delayed(_detect_language)(bio) for bio in df[column])
+    # Missing and whitespace-only bios are labelled 'unknown' upfront, only the rest are sent to the detector.
+    # The column is cast to strings so that .str also works when it was read as floats (e.g. only missing bios)
+    bios = df[column].fillna('').astype(str)
+    mask = bios.str.strip().ne('')
+    # Bios are often repeated (copy-pasted taglines, short catchphrases), so each distinct bio is detected only once
+    to_detect = bios[mask].unique().tolist()
+
+    if backend == 'langdetect':
+        if isinstance(reduced_profiles, (list, tuple)):
+            # Checked here, so that a bad list fails before any worker is started
+            languages = _check_langdetect_languages(reduced_profiles)
+        else:
+            languages = LANGDETECT_LANGUAGES if reduced_profiles else None
+        n_workers = effective_n_jobs(n_jobs)
+        if n_workers == 1:
+            detected = _detect_languages(to_detect, fast_path, languages, seed)
+        else:
+            # A few chunks per worker keeps the workers busy when some chunks hold longer bios than others
+            chunks = np.array_split(np.array(to_detect, dtype=object), n_workers * 4)
+            results = Parallel(n_jobs=n_workers, backend='loky')(
+                delayed(_detect_languages)(chunk, fast_path, languages, seed) for chunk in chunks)
+            detected = [language for chunk in results for language in chunk]
+    elif backend == 'lingua':
+        # lingua detects a whole list of texts in parallel natively, so no joblib workers are needed
+        detected = [_lingua_to_iso(language) for language in _get_lingua_detector().detect_languages_in_parallel_of(to_detect)]
+    elif backend == 'fasttext':
+        detected = _detect_languages_fasttext(to_detect)
+    else:
+        raise ValueError('Invalid backend. Expected "langdetect", "lingua" or "fasttext".')
+
+    # Scatter the detected languages back to their rows
+    languages = pd.Series('unknown', index=df.index, dtype=object)
+    languages[mask] = bios[mask].map(dict(zip(to_detect, detected)))
+    # Only a few dozen distinct labels, so a categorical column stores one small integer code per row
+    df['language'] = languages.astype('category')
     return df
 
+# URLs, and hashtags or mentions, as removed from bios before tokenizing
+_URL_RE = re.compile(r'http\S+|www.\S+')
+_HASHTAG_MENTION_RE = re.compile(r'[@#](\w+)')
+
 def process_text(text, stop_words):
     """
     Processes the input text by removing URLs, hashtags, mentions, punctuation, converting to lowercase, and removing stopwords.
@@ -472,9 +741,9 @@ def process_text(text, stop_words):
     - list: A list of processed words from the input text.
     """
     # Remove URLs
-    text = re.sub(r'http\S+|www.\S+', '', text)
+    text = _URL_RE.sub('', text)
     # Replace hashtags and mentions with just the word
-    text = re.sub(r'[@#](\w+)', r'\1', text)
+    text = _HASHTAG_MENTION_RE.sub(r'\1', text)
     # Tokenize the string into words
     words = nltk.word_tokenize(text)
     # Remove punctuation and convert to lower case
@@ -567,7 +836,7 @@ def get_ngram_freq(text, n):
     - Counter: A Counter object with n-grams as keys and their frequencies as values.
     """
     # Remove URLs
-    text = re.sub(r'http\S+|www.\S+', '', text)
+    text = _URL_RE.sub('', text)
 
     # Tokenize the string into words
     words = word_tokenize(text)
@@ -649,40 +918,165 @@ def find_all_matches2(bio_ngrams, income_df):
 These functions are used to more quickly access the many coordinate files generated from the CA pipeline
 """
 
+# pyarrow's multithreaded CSV reader, used by _read_csv with engine='pyarrow'
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = None
+
+# The strings the pandas parser reads as missing values by default, given to pyarrow so that both engines agree
+_PANDAS_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                     '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+def _read_csv(file_path, dtype=None, chunksize=None, dtype_backend=None, engine='c'):
+    """
+    Reads a CSV file into a DataFrame.
+
+    Parameters:
+    - file_path (str): The path to the CSV file.
+    - dtype (dict, optional): Data types to apply to the columns.
+    - chunksize (int, optional): If set, the file is parsed `chunksize` rows at a time and the chunks are concatenated, 
+                                 which keeps the parser's peak memory well below that of a single full read.
+    - dtype_backend (str, optional): If 'pyarrow', every column is returned with a pyarrow-backed ArrowDtype, so the data 
+                                     stays in Arrow's contiguous buffers instead of being converted to NumPy arrays. 
+                                     None (default) returns pandas' default dtypes.
+    - engine (str, optional): 'c' (default) uses the pandas C parser. 'pyarrow' uses pyarrow's multithreaded reader, which 
+                              is faster on large files. It reads the same missing values as pandas and leaves date-like 
+                              columns as strings, but less common formats may still be parsed differently.
+
+    Returns:
+    - DataFrame: The loaded DataFrame.
+
+    The pandas C parser is also used with engine='pyarrow' for chunked reads, as pyarrow does not read in chunks, and when
+    one of the requested dtypes has no pyarrow equivalent.
+    """
+    if engine not in ('c', 'pyarrow'):
+        raise ValueError('Invalid engine. Expected "c" or "pyarrow".')
+    if engine == 'pyarrow' and pa is None:
+        raise ImportError("engine='pyarrow' requires the pyarrow package.")
+    column_types = _arrow_column_types(dtype) if engine == 'pyarrow' and chunksize is None else None
+
+    # pandas only accepts dtype_backend when it is set
+    backend_kwargs = {'dtype_backend': dtype_backend} if dtype_backend is not None else {}
+
+    if column_types is None:
+        if chunksize is not None:
+            return pd.concat(pd.read_csv(file_path, dtype=dtype, chunksize=chunksize, **backend_kwargs), ignore_index=True)
+        return pd.read_csv(file_path, dtype=dtype, **backend_kwargs)
+
+    # The column types are declared to pyarrow upfront. pandas' own pyarrow engine infers the type first and casts afterwards,
+    # which turns long IDs such as follower_id into floats before they become strings
+    convert_options = pa_csv.ConvertOptions(column_types=column_types, null_values=_PANDAS_NA_VALUES, strings_can_be_null=True)
+
+    # pyarrow infers dates, times and timestamps, which the pandas parser leaves as strings, and gives empty columns a null
+    # type where pandas uses floats (unless dtype_backend is 'pyarrow'). The types are inferred from the first block of the file, as read_csv does, and these
+    # columns are then read as pandas would
+    with pa_csv.open_csv(file_path, convert_options=convert_options) as reader:
+        schema = reader.schema
+    for field in schema:
+        if field.name in column_types:
+            continue
+        if pa.types.is_temporal(field.type):
+            column_types[field.name] = pa.string()
+        elif pa.types.is_null(field.type) and dtype_backend != 'pyarrow':
+            column_types[field.name] = pa.float64()
+    convert_options.column_types = column_types
+
+    table = pa_csv.read_csv(file_path, convert_options=convert_options)
+    df = table.to_pandas(types_mapper=pd.ArrowDtype if dtype_backend == 'pyarrow' else None)
+    if dtype_backend == 'pyarrow':
+        # The pandas parser keeps its default string dtype for the columns requested as str
+        for col in [col for col, col_type in (dtype or {}).items() if col_type is str and col in df.columns]:
+            df[col] = table.column(col).to_pandas()
+
+    # pyarrow marks missing values of object columns (strings, booleans) with None, the pandas parser with NaN
+    object_columns = df.columns[df.dtypes == object]
+    df[object_columns] = df[object_columns].where(df[object_columns].notna(), np.nan)
+
+    # Name header-less columns (e.g. a saved index) the way the pandas parser does
+    df.columns = [col if col else f'Unnamed: {i}' for i, col in enumerate(df.columns)]
+    return df
+
+
+def _arrow_column_types(dtype):
+    """
+    Translates a pandas dtype mapping into pyarrow column types.
+
+    Parameters:
+    - dtype (dict or None): Data types by column name.
+
+    Returns:
+    - dict or None: The pyarrow type of every column, or None if one of the dtypes has no pyarrow equivalent.
+    """
+    column_types = {}
+    for col, col_type in (dtype or {}).items():
+        if col_type is str:
+            column_types[col] = pa.string()
+            continue
+        try:
+            column_types[col] = pa.from_numpy_dtype(np.dtype(col_type))
+        except (TypeError, NotImplementedError, pa.ArrowNotImplementedError):
+            return None
+    return column_types
+
+
+def _read_table(file_path, dtype=None, chunksize=None, fmt='csv', dtype_backend=None, engine='c'):
+    """
+    Reads a table saved as CSV or parquet.
+
+    Parameters:
+    - file_path (str): The path to the file, with its .csv extension. It is swapped for .parquet when fmt is 'parquet'.
+    - dtype (dict, optional): Data types to apply to the columns of CSV files. Parquet files store their own types.
+    - chunksize (int, optional): Passed on to _read_csv for CSV files.
+    - fmt (str, optional): 'csv' (default) or 'parquet'.
+    - dtype_backend (str, optional): None (default) or 'pyarrow', see _read_csv.
+    - engine (str, optional): The CSV parser, 'c' (default) or 'pyarrow', see _read_csv.
+
+    Returns:
+    - DataFrame: The loaded DataFrame.
+    """
+    if fmt == 'csv':
+        return _read_csv(file_path, dtype=dtype, chunksize=chunksize, dtype_backend=dtype_backend, engine=engine)
+    if fmt == 'parquet':
+        backend_kwargs = {'dtype_backend': dtype_backend} if dtype_backend is not None else {}
+        return pd.read_parquet(os.path.splitext(file_path)[0] + '.parquet', engine='pyarrow', **backend_kwargs)
+    raise ValueError('Invalid fmt. Expected "csv" or "parquet".')
+
 
-def load_all_row_coords_files(n):
+def load_all_row_coords_files(n, chunksize=None, fmt='csv', dtype_backend=None, engine='c'):
     files = []  # list to store all dataframes
 
     for file_number in range(1, n+1):
         file_path = f"/home/livtollanes/NewData/coordinates/m{file_number}_coords/m{file_number}_row_coordinates.csv"
         print(f"Used file path: {file_path}") 
-        df = pd.read_csv(file_path, dtype={'follower_id': str})
+        df = _read_table(file_path, dtype={'follower_id': str}, chunksize=chunksize, fmt=fmt, dtype_backend=dtype_backend, engine=engine)
 
         # Add df to list of dataframes
         files.append(df)
 
     return files
 
-def load_all_column_coords_files(n):
+def load_all_column_coords_files(n, chunksize=None, fmt='csv', dtype_backend=None, engine='c'):
     files = []  # list to store all dataframes
 
     for file_number in range(1, n+1):
         file_path = f"/home/livtollanes/NewData/coordinates/m{file_number}_coords/m{file_number}_column_coordinates.csv"
         print(f"Used file path: {file_path}") 
-        df = pd.read_csv(file_path, dtype={'follower_id': str})
+        df = _read_table(file_path, dtype={'follower_id': str}, chunksize=chunksize, fmt=fmt, dtype_backend=dtype_backend, engine=engine)
 
         # Add df to list of dataframes
         files.append(df)
 
     return files
 
-def load_CA_model_files(n):
+def load_CA_model_files(n, chunksize=None, fmt='csv', dtype_backend=None, engine='c'):
     files = []  # list to store all dataframes
 
     for file_number in range(1, n+1):
         file_path = f"/home/livtollanes/NewData/job_title_coordinates/m{file_number}_jobs_rowcoords.csv"
         print(f"Used file path: {file_path}") 
-        df = pd.read_csv(file_path, dtype={'follower_id': str})
+        df = _read_table(file_path, dtype={'follower_id': str}, chunksize=chunksize, fmt=fmt, dtype_backend=dtype_backend, engine=engine)
 
         # Replace spaces in column names with underscores
         df.columns = df.columns.str.replace(' ', '_')
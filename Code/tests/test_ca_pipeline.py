@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+matplotlib.use('Agg')
+# Keep the CA cache of the tests out of the project folder
+os.environ.setdefault('CA_CACHE_DIR', tempfile.mkdtemp(prefix='ca_cache_test_'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Utility files'))
+import ca_pipeline
+
+
+def _edgelist_with_missing_ids():
+    rng = np.random.default_rng(0)
+    n = 300
+    markers = np.array([f'marker{i}' for i in range(8)], dtype=object)
+    df = pd.DataFrame({
+        'follower_id': rng.integers(0, 60, n).astype(float),
+        'twitter_name': markers[rng.integers(0, len(markers), n)],
+    })
+    df['label'] = df['twitter_name'].str.upper()
+    df['type'] = 'brand'
+    df['type2'] = 'brand'
+    # Missing IDs on both sides, including a follower and a marker that only appear next to a missing ID
+    df.loc[[0, 5, 9], 'follower_id'] = np.nan
+    df.loc[[1, 7], 'twitter_name'] = None
+    df.loc[2, ['follower_id', 'twitter_name']] = [1000.0, None]
+    df.loc[3, ['follower_id', 'twitter_name', 'label']] = [np.nan, 'lonely_marker', 'LONELY_MARKER']
+    return df
+
+
+# -------------------
+# create_incidence_matrix
+# -------------------
+
+def test_incidence_matrix_skips_edges_with_missing_ids_like_crosstab():
+    df = _edgelist_with_missing_ids()
+    pipeline = ca_pipeline.PipelineCorAnalysis(df, 'test')
+
+    pipeline.create_incidence_matrix()
+
+    expected = pd.crosstab(df['follower_id'], df['twitter_name'])
+    assert list(pipeline.follower_index) == list(expected.index)
+    assert list(pipeline.marker_index) == list(expected.columns)
+    np.testing.assert_array_equal(pipeline.incidence_matrix.toarray(), expected.to_numpy())
+
+
+# -------------------
+# perform_ca_pipeline
+# -------------------
+
+@pytest.mark.parametrize('engine', ['sparse', 'prince'])
+def test_ca_pipeline_runs_with_missing_ids(engine, tmp_path):
+    df = _edgelist_with_missing_ids()
+    pipeline = ca_pipeline.PipelineCorAnalysis(df, 'test')
+
+    pipeline.perform_ca_pipeline(str(tmp_path), n_components=3, engine=engine)
+
+    expected = pd.crosstab(df['follower_id'], df['twitter_name'])
+    rows = pd.read_csv(tmp_path / 'test_coords' / 'test_row_coordinates.csv', index_col=0)
+    columns = pd.read_csv(tmp_path / 'test_coords' / 'test_column_coordinates.csv', index_col=0)
+    assert list(rows.index) == list(expected.index)
+    assert sorted(columns['twitter_name']) == sorted(expected.columns)
+
+
+# -------------------
+# top_five_markers_in_degree
+# -------------------
+
+def test_top_five_markers_shows_the_type_of_the_first_row(capsys):
+    df = pd.DataFrame({'follower_id': [1, 2, 3, 1], 'twitter_name': ['m1', 'm1', 'm1', 'm2'],
+                       'type2': ['consumption', 'education', 'education', 'information']})
+    pipeline = ca_pipeline.PipelineCorAnalysis(df, 'test')
+    pipeline.create_bipartite_graph()
+
+    pipeline.top_five_markers_in_degree()
+
+    out = capsys.readouterr().out
+    assert 'Marker: m1, Type: consumption' in out
+    assert 'Marker: m2, Type: information' in out
+
+
+def test_top_five_markers_without_type2_column(capsys):
+    df = pd.DataFrame({'follower_id': [1, 2, 1], 'twitter_name': ['m1', 'm1', 'm2']})
+    pipeline = ca_pipeline.PipelineCorAnalysis(df, 'test')
+    pipeline.create_bipartite_graph()
+
+    pipeline.top_five_markers_in_degree()
+
+    out = capsys.readouterr().out
+    assert "no 'type2' column" in out
+    assert 'Marker: m1, In-Degree Centrality' in out
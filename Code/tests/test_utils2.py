@@ -0,0 +1,126 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Utility files'))
+import utils2
+
+
+# -------------------
+# streamline_IDs
+# -------------------
+
+def test_streamline_ids_keeps_missing_ids_present_in_source(capsys):
+    source = pd.DataFrame({'follower_id': pd.Series(['a', None, 'b'], dtype=object)})
+    df = pd.DataFrame({'follower_id': pd.Series(['a', np.nan, 'c', None, 'b'], dtype=object), 'v': range(5)})
+
+    filtered = utils2.streamline_IDs(source, df, 'follower_id')
+
+    # Same rows as isin: None matches the source's None, NaN does not
+    assert filtered.equals(df[df['follower_id'].isin(source['follower_id'])])
+    assert filtered['v'].tolist() == [0, 3, 4]
+    out = capsys.readouterr().out
+    assert 'Number of unique follower_id in source DataFrame: 2' in out
+    assert 'Number of unique follower_id in filtered DataFrame after filtering: 2' in out
+    assert 'Removed 2 rows' in out
+
+
+def test_streamline_ids_with_nan_ids_in_both_frames(capsys):
+    source = pd.DataFrame({'follower_id': [1.0, np.nan, 3.0]})
+    df = pd.DataFrame({'follower_id': [np.nan, 1.0, 2.0, np.nan], 'v': range(4)})
+
+    filtered = utils2.streamline_IDs(source, df, 'follower_id')
+
+    assert filtered['v'].tolist() == [0, 1, 3]
+    out = capsys.readouterr().out
+    assert 'Number of unique follower_id in filtered DataFrame after filtering: 1' in out
+    assert '3 rows are left' in out
+
+
+def test_streamline_ids_drops_missing_ids_absent_from_source(capsys):
+    source = pd.DataFrame({'follower_id': [1.0, 3.0]})
+    df = pd.DataFrame({'follower_id': [np.nan, 1.0, 2.0], 'v': range(3)})
+
+    filtered = utils2.streamline_IDs(source, df, 'follower_id')
+
+    assert filtered['v'].tolist() == [1]
+    assert 'Number of unique follower_id in filtered DataFrame after filtering: 1' in capsys.readouterr().out
+
+
+# -------------------
+# process_description
+# -------------------
+
+def test_process_description_leaves_existing_cleantext_column_of_input_unchanged():
+    df = pd.DataFrame({'description': ['Bonjour 😀', None], 'description_cleantext': ['old', 'old']})
+
+    out = utils2.process_description(df, 'description', n_jobs=1)
+
+    assert df['description_cleantext'].tolist() == ['old', 'old']
+    assert out['description_cleantext'].tolist() == ['Bonjour ', '']
+
+
+# -------------------
+# _read_csv
+# -------------------
+
+@pytest.mark.parametrize('dtype', [None, {'follower_id': str}])
+@pytest.mark.parametrize('dtype_backend', [None, 'pyarrow'])
+def test_read_csv_engines_give_the_same_dataframe(tmp_path, dtype, dtype_backend):
+    pytest.importorskip('pyarrow')
+    file_path = tmp_path / 'coords.csv'
+    file_path.write_text(
+        ',follower_id,name,date,timestamp,time,x,empty\n'
+        '0,123456789012345678,None,2020-01-01,2020-01-01 10:00:00,10:00:00,1.5,\n'
+        '1,223456789012345678,NA,2021-02-03,2021-02-03T11:00:00,11:30,,\n'
+        '2,,bob,,,,-2.0,\n'
+    )
+
+    expected = utils2._read_csv(file_path, dtype=dtype, dtype_backend=dtype_backend)
+    result = utils2._read_csv(file_path, dtype=dtype, dtype_backend=dtype_backend, engine='pyarrow')
+
+    pd.testing.assert_frame_equal(result, expected)
+    assert expected['name'].isna().tolist() == [True, True, False]
+
+
+# -------------------
+# summary_stats
+# -------------------
+
+@pytest.mark.parametrize('dtype', [object, pd.CategoricalDtype(['a', 'b', 'c'])])
+def test_summary_stats_counts_unique_and_duplicate_ids(capsys, dtype):
+    df = pd.DataFrame({'follower_id': pd.Series(['a', 'a', None], dtype=dtype)})
+
+    utils2.summary_stats(df, print_dtypes=False)
+
+    out = capsys.readouterr().out
+    assert "Number of unique values in 'follower_id':  1" in out
+    assert "Number of duplicate values in 'follower_id':  1" in out
+
+
+# -------------------
+# add_and_detect_language
+# -------------------
+
+@pytest.mark.parametrize('reduced_profiles', [['fr'], ['fr', 'fr'], ['fr', 'xx']])
+def test_add_and_detect_language_rejects_invalid_reduced_profiles(reduced_profiles):
+    df = pd.DataFrame({'description': ['Bonjour, je suis étudiante à Paris']})
+
+    with pytest.raises(ValueError):
+        utils2.add_and_detect_language(df, 'description', n_jobs=1, reduced_profiles=reduced_profiles)
+
+
+def test_add_and_detect_language_with_two_reduced_profiles():
+    df = pd.DataFrame({'description': ['Bonjour, je suis étudiante à Paris', 'Hello, I am a student in London', None]})
+
+    out = utils2.add_and_detect_language(df, 'description', n_jobs=1, reduced_profiles=['fr', 'en'])
+
+    assert out['language'].tolist() == ['fr', 'en', 'unknown']
+
+
+def test_load_langdetect_profiles_rejects_a_single_language():
+    with pytest.raises(ValueError):
+        utils2._load_langdetect_profiles(['fr'])